@@ -15,40 +15,224 @@ Usage:
   python mcp_client.py session < commands.txt
 
 Environment variables (set via config.sh or directly):
-  FLAUI_SSH_HOST    - SSH target (default: windows-vm)
-  FLAUI_DLL_PATH    - Path to FlaUI.Mcp.dll on Windows
-  FLAUI_MCP_TIMEOUT - Timeout in seconds (default: 30)
+  FLAUI_SSH_HOST             - SSH target (default: windows-vm)
+  FLAUI_DLL_PATH             - Path to FlaUI.Mcp.dll on Windows
+  FLAUI_MCP_TIMEOUT          - Timeout in seconds (default: 30)
+  FLAUI_SSH_CONTROL_PREWARM  - Set to 1 to start the SSH control master up front
+  FLAUI_SSH_COMPRESS         - Set to 1 to compress the SSH stream (useful on
+                               slow links; skip on LAN to save CPU)
+
+Connections use OpenSSH ControlMaster multiplexing so repeated invocations
+(e.g. CI loops calling `mcp_client.py call ...`) attach to a persistent
+master channel instead of paying a full TCP + key-exchange + auth handshake
+each time. Requires ~/.ssh to have mode 700 (OpenSSH refuses the control
+socket otherwise).
 """
 
 import asyncio
+import functools
 import json
 import os
+import subprocess
 import sys
+from contextlib import AsyncExitStack
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+# Prefer orjson (C extension, ~3-10x faster parse) for the JSON hot paths;
+# fall back to the stdlib so the client works without extra dependencies.
+try:
+    import orjson
 
-def get_server_params() -> StdioServerParameters:
-    """Build StdioServerParameters for SSH connection to the MCP server."""
+    def _loads(s):
+        return orjson.loads(s)
+
+    def _dumps(obj, indent: int | None = 2) -> str:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, option=option).decode()
+
+    def _emit_response(obj, indent: int | None = 2) -> None:
+        """Write one session response plus COMMAND_DONE in a single syscall.
+
+        Writes orjson's bytes straight to the stdout buffer, skipping the
+        str decode/re-encode round-trip.
+        """
+        option = orjson.OPT_INDENT_2 if indent else 0
+        sys.stdout.flush()
+        sys.stdout.buffer.write(orjson.dumps(obj, option=option) + b"\nCOMMAND_DONE\n")
+        sys.stdout.buffer.flush()
+except ImportError:
+    def _loads(s):
+        return json.loads(s)
+
+    def _dumps(obj, indent: int | None = 2) -> str:
+        return json.dumps(obj, indent=indent)
+
+    def _emit_response(obj, indent: int | None = 2) -> None:
+        """Write one session response plus COMMAND_DONE in a single syscall."""
+        sys.stdout.write(_dumps(obj, indent=indent) + "\nCOMMAND_DONE\n")
+        sys.stdout.flush()
+
+
+def _ssh_control_args() -> list[str]:
+    """SSH options enabling connection multiplexing via a shared control socket."""
+    control_path = os.path.expanduser("~/.ssh/cm-flaui-%r@%h:%p")
+    return [
+        "-o", "ControlMaster=auto",
+        "-o", f"ControlPath={control_path}",
+        "-o", "ControlPersist=600",
+    ]
+
+
+def _prewarm_control_master() -> None:
+    """Start a background SSH control master so the first MCP call skips the handshake."""
     host = os.environ.get("FLAUI_SSH_HOST", "windows-vm")
-    dll_path = os.environ.get(
-        "FLAUI_DLL_PATH",
-        "C:/Users/Joe/github/repos/FlaUI-MCP/src/FlaUI.Mcp/bin/Debug/net10.0-windows/FlaUI.Mcp.dll",
+    subprocess.run(
+        ["ssh", *_ssh_control_args(), "-N", "-f", host],
+        check=False,
     )
-    return StdioServerParameters(
-        command="ssh",
-        args=[
-            "-o", "ServerAliveInterval=30",
-            "-o", "ServerAliveCountMax=3",
-            host,
-            "dotnet", dll_path,
-        ],
+
+
+@functools.lru_cache(maxsize=None)
+def _params_for(host: str, dll_path: str, compress: bool) -> StdioServerParameters:
+    args = [
+        # No PTY: line-discipline processing would munge the raw JSON-RPC
+        # stream, and BatchMode fails fast in CI instead of hanging on a
+        # password prompt. LogLevel=ERROR keeps ssh chatter off stderr.
+        "-T",
+        "-o", "BatchMode=yes",
+        "-o", "LogLevel=ERROR",
+        "-o", "ServerAliveInterval=30",
+        "-o", "ServerAliveCountMax=3",
+        # chacha20 is fastest on CPUs without AES-NI; aes128-gcm wins with it
+        "-o", "Ciphers=chacha20-poly1305@openssh.com,aes128-gcm@openssh.com",
+        # MCP streams bulk JSON, so prefer throughput over latency DSCP marks
+        "-o", "IPQoS=throughput",
+        *_ssh_control_args(),
+    ]
+    if compress:
+        args += ["-o", "Compression=yes"]
+    args += [host, "dotnet", dll_path]
+    return StdioServerParameters(command="ssh", args=args)
+
+
+def get_server_params() -> StdioServerParameters:
+    """Build StdioServerParameters for SSH connection to the MCP server.
+
+    Cached per (host, dll) so all entrypoints share an identical params
+    object — the session pool keys on it. Call _params_for.cache_clear()
+    if the env changes mid-run.
+    """
+    return _params_for(
+        os.environ.get("FLAUI_SSH_HOST", "windows-vm"),
+        os.environ.get(
+            "FLAUI_DLL_PATH",
+            "C:/Users/Joe/github/repos/FlaUI-MCP/src/FlaUI.Mcp/bin/Debug/net10.0-windows/FlaUI.Mcp.dll",
+        ),
+        os.environ.get("FLAUI_SSH_COMPRESS", "0") == "1",
     )
 
 
+class _SessionPool:
+    """Caches initialized ClientSessions keyed by server params.
+
+    The MCP initialize handshake plus SSH + dotnet startup dominates
+    wall-clock for scripted call sequences; reusing one session collapses
+    N handshakes into 1. Sessions stay open until aclose(), which must run
+    on the same event loop that created them (the underlying anyio task
+    groups are loop-bound).
+    """
+
+    def __init__(self):
+        self._sessions: dict[tuple, tuple[AsyncExitStack, ClientSession]] = {}
+
+    @staticmethod
+    def _key(params: StdioServerParameters) -> tuple:
+        return (params.command, tuple(params.args))
+
+    async def acquire(self, params: StdioServerParameters) -> ClientSession:
+        """Return an initialized session for params, connecting on first use."""
+        key = self._key(params)
+        entry = self._sessions.get(key)
+        if entry is not None:
+            return entry[1]
+        stack = AsyncExitStack()
+        try:
+            read, write = await stack.enter_async_context(stdio_client(params))
+            session = await stack.enter_async_context(
+                ClientSession(read, write, message_handler=_on_server_message)
+            )
+            await session.initialize()
+        except BaseException:
+            await stack.aclose()
+            raise
+        self._sessions[key] = (stack, session)
+        return session
+
+    async def aclose(self) -> None:
+        """Tear down all pooled sessions and their transports."""
+        while self._sessions:
+            _, (stack, session) = self._sessions.popitem()
+            _TOOLS_CACHE.pop(id(session), None)
+            await stack.aclose()
+
+
+_POOL = _SessionPool()
+
+
+async def _with_pool_cleanup(coro):
+    """Await coro, then close the pool on the same event loop."""
+    try:
+        return await coro
+    finally:
+        await _POOL.aclose()
+
+
+def keepalive_interval() -> float:
+    """Seconds between MCP-level pings (FLAUI_KEEPALIVE_INTERVAL, default 25)."""
+    return float(os.environ.get("FLAUI_KEEPALIVE_INTERVAL", "25"))
+
+
+async def keepalive(session: ClientSession, interval: float) -> None:
+    """Ping the server every `interval` seconds while the session is live.
+
+    NAT/firewall middleboxes silently drop idle streams; ServerAliveInterval
+    only keeps the TCP layer warm, so ping at the MCP layer too. Exits on
+    the first failed ping (the session is already dead at that point).
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await session.send_ping()
+        except Exception:
+            return
+
+
+# Cached list_tools responses keyed by id(session); the server-side tool
+# set changes rarely, so repeat listings skip the round-trip entirely.
+_TOOLS_CACHE: dict[int, list[dict]] = {}
+
+
+async def _on_server_message(message) -> None:
+    """Session message handler: drop cached tool lists when the server
+    announces notifications/tools/list_changed."""
+    method = getattr(getattr(message, "root", message), "method", None)
+    if method == "notifications/tools/list_changed":
+        _TOOLS_CACHE.clear()
+
+
 async def list_tools(session: ClientSession) -> list[dict]:
-    """List all tools from the MCP server. Returns list of tool dicts."""
+    """List all tools from the MCP server. Returns list of tool dicts.
+
+    Cached per session until the server sends tools/list_changed; set
+    FLAUI_NO_TOOLS_CACHE=1 to force a fresh fetch every call.
+    """
+    use_cache = os.environ.get("FLAUI_NO_TOOLS_CACHE") != "1"
+    if use_cache:
+        cached = _TOOLS_CACHE.get(id(session))
+        if cached is not None:
+            return cached
     result = await session.list_tools()
     tools = []
     for tool in result.tools:
@@ -56,55 +240,90 @@ async def list_tools(session: ClientSession) -> list[dict]:
             "name": tool.name,
             "description": tool.description,
         })
+    if use_cache:
+        _TOOLS_CACHE[id(session)] = tools
     return tools
 
 
 async def call_tool(session: ClientSession, name: str, arguments: dict | None = None) -> dict:
     """Call a tool and return the response as a dict."""
     result = await session.call_tool(name, arguments=arguments or {})
-    contents = []
-    for item in result.content:
-        entry = {"type": item.type}
-        if item.type == "text":
-            entry["text"] = item.text
-            # Try to parse JSON text for structured output
-            try:
-                entry["parsed"] = json.loads(item.text)
-            except (json.JSONDecodeError, TypeError):
-                pass
-        elif item.type == "image":
-            entry["mimeType"] = getattr(item, "mimeType", None)
-            entry["data_length"] = len(item.data) if getattr(item, "data", None) else 0
-        elif item.type == "resource":
-            entry["uri"] = getattr(item, "uri", None)
-            entry["mimeType"] = getattr(item, "mimeType", None)
-        contents.append(entry)
+    # Snapshot responses can carry hundreds of content items, making this
+    # loop the client's hot path: preallocate the output list, hoist the
+    # getattr lookup, and build each entry as a single dict literal.
+    items = result.content
+    contents = [None] * len(items)
+    _get = getattr
+    for i, item in enumerate(items):
+        item_type = item.type
+        if item_type == "text":
+            text = item.text
+            entry = {"type": "text", "text": text}
+            # Only attempt a JSON parse when the payload looks like JSON;
+            # most large payloads (snapshots, logs) are plain text and each
+            # failed loads allocates an exception object.
+            if text.lstrip()[:1] in ("{", "["):
+                try:
+                    entry["parsed"] = _loads(text)
+                except ValueError:
+                    pass
+        elif item_type == "image":
+            data = _get(item, "data", None)
+            entry = {
+                "type": "image",
+                "mimeType": _get(item, "mimeType", None),
+                "data_length": len(data) if data else 0,
+            }
+        else:
+            entry = {
+                "type": item_type,
+                "uri": _get(item, "uri", None),
+                "mimeType": _get(item, "mimeType", None),
+            }
+        contents[i] = entry
     return {
         "isError": result.isError,
         "content": contents,
     }
 
 
+async def call_many(
+    session: ClientSession,
+    calls: list[tuple[str, dict | None]],
+    max_inflight: int | None = None,
+) -> list[dict]:
+    """Issue several tool calls concurrently over one session.
+
+    calls is a list of (tool_name, arguments) pairs; results come back in
+    the same order. Round-trips overlap instead of serializing, bounded by
+    max_inflight (FLAUI_MAX_INFLIGHT, default 8) so large batches cannot
+    flood the server.
+    """
+    if max_inflight is None:
+        max_inflight = int(os.environ.get("FLAUI_MAX_INFLIGHT", "8"))
+    sem = asyncio.Semaphore(max_inflight)
+
+    async def _one(name: str, arguments: dict | None) -> dict:
+        async with sem:
+            return await call_tool(session, name, arguments)
+
+    return await asyncio.gather(*(_one(name, args) for name, args in calls))
+
+
 async def run_list():
-    """One-shot: connect, list tools, print, disconnect."""
-    params = get_server_params()
-    async with stdio_client(params) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            tools = await list_tools(session)
-            print(json.dumps(tools, indent=2))
-            return tools
+    """List tools via the shared session pool and print them."""
+    session = await _POOL.acquire(get_server_params())
+    tools = await list_tools(session)
+    print(_dumps(tools))
+    return tools
 
 
 async def run_call(tool_name: str, arguments: dict | None = None):
-    """One-shot: connect, call one tool, print response, disconnect."""
-    params = get_server_params()
-    async with stdio_client(params) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            result = await call_tool(session, tool_name, arguments)
-            print(json.dumps(result, indent=2))
-            return result
+    """Call one tool via the shared session pool and print the response."""
+    session = await _POOL.acquire(get_server_params())
+    result = await call_tool(session, tool_name, arguments)
+    print(_dumps(result))
+    return result
 
 
 async def run_session():
@@ -113,42 +332,85 @@ async def run_session():
     Commands (one per line):
       list
       call <tool_name> [json_arguments]
+      callmany <json-array of {"name": ..., "arguments": ...}>
       quit
     """
     params = get_server_params()
     async with stdio_client(params) as (read, write):
-        async with ClientSession(read, write) as session:
+        async with ClientSession(read, write, message_handler=_on_server_message) as session:
             await session.initialize()
             print("SESSION_READY", flush=True)
 
-            for line in sys.stdin:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                if line == "quit":
-                    break
-
-                parts = line.split(None, 2)
-                cmd = parts[0]
-
-                if cmd == "list":
-                    tools = await list_tools(session)
-                    print(json.dumps(tools, indent=2), flush=True)
-                elif cmd == "call" and len(parts) >= 2:
-                    tool_name = parts[1]
-                    arguments = None
-                    if len(parts) == 3:
+            # Read stdin through the event loop; a blocking `for line in
+            # sys.stdin` would starve the keepalive task and the MCP read
+            # task while waiting for operator input. connect_read_pipe only
+            # accepts pipes/ttys, so when stdin is redirected from a regular
+            # file (`session < commands.txt`) fall back to executor reads.
+            # StreamReader's default 64 KiB line limit is too small for
+            # commands carrying large payloads (windows_fill text, big
+            # callmany arrays); the old blocking loop had no such cap.
+            loop = asyncio.get_running_loop()
+            try:
+                reader = asyncio.StreamReader(limit=16 * 1024 * 1024)
+                await loop.connect_read_pipe(
+                    lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+                )
+
+                async def readline() -> bytes:
+                    return await reader.readline()
+            except (ValueError, OSError):
+                async def readline() -> bytes:
+                    return await loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+            ka = asyncio.create_task(keepalive(session, keepalive_interval()))
+            try:
+                while True:
+                    raw = await readline()
+                    if not raw:
+                        break
+                    line = raw.decode().strip()
+                    if not line or line.startswith("#"):
+                        continue
+                    if line == "quit":
+                        break
+
+                    parts = line.split(None, 2)
+                    cmd = parts[0]
+
+                    if cmd == "list":
+                        tools = await list_tools(session)
+                        _emit_response(tools)
+                    elif cmd == "call" and len(parts) >= 2:
+                        tool_name = parts[1]
+                        arguments = None
+                        if len(parts) == 3:
+                            try:
+                                arguments = _loads(parts[2])
+                            except ValueError as e:
+                                print(_dumps({"error": f"Invalid JSON: {e}"}, indent=None), flush=True)
+                                continue
+                        result = await call_tool(session, tool_name, arguments)
+                        _emit_response(result)
+                    elif cmd == "callmany" and len(parts) >= 2:
                         try:
-                            arguments = json.loads(parts[2])
-                        except json.JSONDecodeError as e:
-                            print(json.dumps({"error": f"Invalid JSON: {e}"}), flush=True)
+                            batch = _loads(line.split(None, 1)[1])
+                        except ValueError as e:
+                            print(_dumps({"error": f"Invalid JSON: {e}"}, indent=None), flush=True)
                             continue
-                    result = await call_tool(session, tool_name, arguments)
-                    print(json.dumps(result, indent=2), flush=True)
-                else:
-                    print(json.dumps({"error": f"Unknown command: {line}"}), flush=True)
-
-                print("COMMAND_DONE", flush=True)
+                        if not isinstance(batch, list) or not all(
+                            isinstance(c, dict) and "name" in c for c in batch
+                        ):
+                            print(_dumps({"error": "callmany expects a JSON array of {name, arguments} objects"}, indent=None), flush=True)
+                            continue
+                        results = await call_many(
+                            session, [(c["name"], c.get("arguments")) for c in batch]
+                        )
+                        _emit_response(results)
+                    else:
+                        _emit_response({"error": f"Unknown command: {line}"}, indent=None)
+            finally:
+                ka.cancel()
+                await asyncio.gather(ka, return_exceptions=True)
 
 
 def main():
@@ -158,8 +420,11 @@ def main():
 
     mode = sys.argv[1]
 
+    if os.environ.get("FLAUI_SSH_CONTROL_PREWARM") == "1":
+        _prewarm_control_master()
+
     if mode == "list":
-        asyncio.run(run_list())
+        asyncio.run(_with_pool_cleanup(run_list()))
     elif mode == "call":
         if len(sys.argv) < 3:
             print("Usage: mcp_client.py call <tool_name> [json_arguments]", file=sys.stderr)
@@ -168,11 +433,11 @@ def main():
         arguments = None
         if len(sys.argv) >= 4:
             try:
-                arguments = json.loads(sys.argv[3])
-            except json.JSONDecodeError as e:
+                arguments = _loads(sys.argv[3])
+            except ValueError as e:
                 print(f"Invalid JSON argument: {e}", file=sys.stderr)
                 sys.exit(1)
-        asyncio.run(run_call(tool_name, arguments))
+        asyncio.run(_with_pool_cleanup(run_call(tool_name, arguments)))
     elif mode == "session":
         asyncio.run(run_session())
     else:
@@ -17,17 +17,60 @@ Usage:
 """
 
 import asyncio
-import json
 import os
 import sys
 import time
+from typing import Callable
 
 # Add test directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from mcp_client import get_server_params, list_tools, call_tool
-
-from mcp import ClientSession
-from mcp.client.stdio import stdio_client
+from mcp_client import (
+    get_server_params,
+    list_tools,
+    call_tool,
+    keepalive,
+    keepalive_interval,
+    _dumps,
+    _POOL,
+)
+
+
+def _window_ids(resp: dict) -> set:
+    """Collect window handles from a windows_list_windows response.
+
+    Understands both structured content (parsed JSON with windowId fields)
+    and the server's plain-text line format ('- w1: "title" (process)').
+    Avoids re-serializing the whole response just to substring-match a
+    handle, which is slow for many windows and can false-match (w1 in w10).
+    """
+    ids = set()
+    for content in resp.get("content", []):
+        parsed = content.get("parsed")
+        if isinstance(parsed, dict):
+            items = [parsed]
+        elif isinstance(parsed, list):
+            items = parsed
+        else:
+            items = []
+        for item in items:
+            if isinstance(item, dict) and "windowId" in item:
+                ids.add(item["windowId"])
+        if not items:
+            for line in (content.get("text") or "").splitlines():
+                line = line.strip()
+                if line.startswith("- ") and ":" in line:
+                    ids.add(line[2:].split(":", 1)[0].strip())
+    return ids
+
+
+async def _wait_until(predicate, timeout: float, interval: float = 0.05) -> bool:
+    """Poll an async predicate until it returns True or timeout elapses."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await predicate():
+            return True
+        await asyncio.sleep(interval)
+    return False
 
 
 class TestResult:
@@ -35,14 +78,17 @@ class TestResult:
         self.passed = 0
         self.failed = 0
 
-    def check(self, name: str, condition: bool, detail: str = ""):
+    def check(self, name: str, condition: bool, detail: str | Callable[[], str] = ""):
         if condition:
             print(f"  PASS: {name}")
             self.passed += 1
         else:
+            # detail may be a callable so passing checks never pay for
+            # serializing a (possibly large) response they won't print
+            d = detail() if callable(detail) else detail
             msg = f"  FAIL: {name}"
-            if detail:
-                msg += f" ({detail})"
+            if d:
+                msg += f" ({d})"
             print(msg)
             self.failed += 1
         return condition
@@ -56,85 +102,113 @@ class TestResult:
 async def run_notepad_test():
     """Run the full Notepad integration test."""
     result = TestResult()
-    params = get_server_params()
     window_handle = None
 
-    async with stdio_client(params) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            print("=== Session initialized ===\n")
-
-            # --- Step 1: Launch Notepad ---
-            print("--- Step 1: Launch Notepad ---")
-            launch = await call_tool(session, "windows_launch", {"app": "notepad.exe"})
-            is_not_error = not launch.get("isError", False)
-            result.check("Launch Notepad", is_not_error,
-                         json.dumps(launch) if not is_not_error else "")
-
-            if is_not_error:
-                # Extract window handle from response
-                for content in launch.get("content", []):
-                    parsed = content.get("parsed", {})
-                    if isinstance(parsed, dict) and "windowId" in parsed:
-                        window_handle = parsed["windowId"]
-                        break
-                result.check("Got window handle", window_handle is not None)
-
-            # Brief pause for window to render
-            await asyncio.sleep(1)
-
-            # --- Step 2: Take snapshot ---
-            print("\n--- Step 2: Take snapshot ---")
-            if window_handle:
-                snapshot = await call_tool(session, "windows_snapshot", {"windowId": window_handle})
-                snap_ok = not snapshot.get("isError", False)
-                result.check("Snapshot succeeded", snap_ok,
-                             json.dumps(snapshot) if not snap_ok else "")
-
-                # Verify snapshot contains element refs
-                if snap_ok:
-                    for content in snapshot.get("content", []):
-                        text = content.get("text", "")
-                        has_refs = "e" in text  # Element refs like w1e5
-                        result.check("Snapshot contains element refs", has_refs)
-                        break
-            else:
-                result.check("Snapshot (skipped - no window handle)", False)
-
-            # --- Step 3: Verify window in list ---
-            print("\n--- Step 3: Verify window in list ---")
+    # Acquire from the shared pool: repeated invocations reuse the warm SSH
+    # connection via the ControlMaster socket instead of paying a fresh
+    # SSH + dotnet startup per run.
+    session = await _POOL.acquire(get_server_params())
+    print("=== Session initialized ===\n")
+
+    # Heartbeat so idle gaps between steps can't tear down the SSH channel
+    ka = asyncio.create_task(keepalive(session, keepalive_interval()))
+    try:
+        # --- Step 1: Launch Notepad ---
+        print("--- Step 1: Launch Notepad ---")
+        launch = await call_tool(session, "windows_launch", {"app": "notepad.exe"})
+        is_not_error = not launch.get("isError", False)
+        result.check("Launch Notepad", is_not_error, lambda: _dumps(launch))
+
+        if is_not_error:
+            # Extract window handle from response
+            for content in launch.get("content", []):
+                parsed = content.get("parsed", {})
+                if isinstance(parsed, dict) and "windowId" in parsed:
+                    window_handle = parsed["windowId"]
+                    break
+            result.check("Got window handle", window_handle is not None)
+
+        # Poll until the window shows up instead of a fixed render sleep;
+        # typical render finishes in tens of ms, so this usually returns
+        # almost immediately while still tolerating slow VMs.
+        async def _window_present():
+            listing = await call_tool(session, "windows_list_windows")
+            return window_handle in _window_ids(listing)
+
+        if window_handle:
+            await _wait_until(_window_present, timeout=2.0)
+
+        # Steps 2 and 3 are independent given a window handle, so
+        # issue both calls together and let the round-trips overlap
+        # (MCP over stdio interleaves in-flight requests by id).
+        if window_handle:
+            snapshot, windows = await asyncio.gather(
+                call_tool(session, "windows_snapshot", {"windowId": window_handle}),
+                call_tool(session, "windows_list_windows"),
+            )
+        else:
+            snapshot = None
             windows = await call_tool(session, "windows_list_windows")
-            list_ok = not windows.get("isError", False)
-            result.check("List windows succeeded", list_ok)
-
-            if list_ok and window_handle:
-                # Check that our window handle appears in the response
-                response_text = json.dumps(windows)
-                found = window_handle in response_text
-                result.check(f"Window {window_handle} in list", found)
-
-            # --- Step 4: Close the window ---
-            print("\n--- Step 4: Close window ---")
-            if window_handle:
-                close = await call_tool(session, "windows_close", {"windowId": window_handle})
-                close_ok = not close.get("isError", False)
-                result.check("Close window succeeded", close_ok,
-                             json.dumps(close) if not close_ok else "")
-            else:
-                result.check("Close window (skipped - no handle)", False)
-
-            await asyncio.sleep(1)
-
-            # --- Step 5: Verify window is gone ---
-            print("\n--- Step 5: Verify window is gone ---")
-            windows2 = await call_tool(session, "windows_list_windows")
-            list2_ok = not windows2.get("isError", False)
-            result.check("List windows after close succeeded", list2_ok)
-
-            if list2_ok and window_handle:
-                response_text = json.dumps(windows2)
-                gone = window_handle not in response_text
-                result.check(f"Window {window_handle} no longer in list", gone)
+
+        # --- Step 2: Take snapshot ---
+        print("\n--- Step 2: Take snapshot ---")
+        if snapshot is not None:
+            snap_ok = not snapshot.get("isError", False)
+            result.check("Snapshot succeeded", snap_ok, lambda: _dumps(snapshot))
+
+            # Verify snapshot contains element refs
+            if snap_ok:
+                for content in snapshot.get("content", []):
+                    text = content.get("text", "")
+                    has_refs = "e" in text  # Element refs like w1e5
+                    result.check("Snapshot contains element refs", has_refs)
+                    break
+        else:
+            result.check("Snapshot (skipped - no window handle)", False)
+
+        # --- Step 3: Verify window in list ---
+        print("\n--- Step 3: Verify window in list ---")
+        list_ok = not windows.get("isError", False)
+        result.check("List windows succeeded", list_ok)
+
+        if list_ok and window_handle:
+            # Check that our window handle appears in the response
+            found = window_handle in _window_ids(windows)
+            result.check(f"Window {window_handle} in list", found)
+
+        # --- Step 4: Close the window ---
+        print("\n--- Step 4: Close window ---")
+        if window_handle:
+            close = await call_tool(session, "windows_close", {"windowId": window_handle})
+            close_ok = not close.get("isError", False)
+            result.check("Close window succeeded", close_ok, lambda: _dumps(close))
+        else:
+            result.check("Close window (skipped - no handle)", False)
+
+        # Same idea after close: wait for the window to actually disappear
+        async def _window_gone():
+            listing = await call_tool(session, "windows_list_windows")
+            return window_handle not in _window_ids(listing)
+
+        if window_handle:
+            await _wait_until(_window_gone, timeout=2.0)
+
+        # --- Step 5: Verify window is gone ---
+        print("\n--- Step 5: Verify window is gone ---")
+        windows2 = await call_tool(session, "windows_list_windows")
+        list2_ok = not windows2.get("isError", False)
+        result.check("List windows after close succeeded", list2_ok)
+
+        if list2_ok and window_handle:
+            gone = window_handle not in _window_ids(windows2)
+            result.check(f"Window {window_handle} no longer in list", gone)
+    finally:
+        ka.cancel()
+        await asyncio.gather(ka, return_exceptions=True)
+        # Set FLAUI_TEST_CLEANUP=0 to leave the session open for callers
+        # driving multiple test runs on one event loop.
+        if os.environ.get("FLAUI_TEST_CLEANUP", "1") == "1":
+            await _POOL.aclose()
 
     return result.summary()
 